@@ -3,8 +3,9 @@ from ninja.security import django_auth
 
 from users.api import router as user_router
 from loans.api import router as loan_router
+from .renderers import ORJSONRenderer
 
-api = NinjaAPI(csrf=True)
+api = NinjaAPI(csrf=True, renderer=ORJSONRenderer())
 
 
 api.add_router("/users/", user_router, auth=django_auth)
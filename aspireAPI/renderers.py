@@ -0,0 +1,17 @@
+import orjson
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    JSON renderer for the API backed by orjson
+    Types orjson cannot serialize natively (ex- Decimal) are encoded
+    the same way as Ninja's default JSON renderer
+    """
+
+    media_type = "application/json"
+    encoder = NinjaJSONEncoder()
+
+    def render(self, request, data, *, response_status):
+        return orjson.dumps(data, default=self.encoder.default)
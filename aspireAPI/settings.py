@@ -47,12 +47,20 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "users.middleware.LoadUserMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
 ROOT_URLCONF = "aspireAPI.urls"
 AUTH_USER_MODEL = "users.User"
+# ModelBackend stays listed so sessions created before UserBackend still resolve
+# their user. UserBackend settles every login attempt, ModelBackend never
+# re-checks the credentials
+AUTHENTICATION_BACKENDS = [
+    "users.backends.UserBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
 
 TEMPLATES = [
     {
@@ -0,0 +1,10 @@
+"""
+Django settings used when running the test suite.
+
+Imports the project settings and overrides what only slows tests down.
+"""
+
+from .settings import *  # noqa: F401, F403
+
+# A single MD5 round instead of PBKDF2, test users are created and logged in a lot
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
@@ -0,0 +1,20 @@
+import os
+import time
+import uuid
+
+
+def time_ordered_uuid() -> uuid.UUID:
+    """
+    Generate a version 7 UUID: 48 bits of unix time in milliseconds
+    followed by random bits. Ids generated later sort after earlier ones,
+    so new rows are appended to the end of the primary key and foreign key
+    indexes instead of being inserted at random pages.
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    value = (timestamp_ms & ((1 << 48) - 1)) << 80 | int.from_bytes(
+        os.urandom(10), "big"
+    )
+    # Set the version (7) and the RFC 4122 variant bits
+    value = (value & ~(0xF << 76)) | (0x7 << 76)
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)
+    return uuid.UUID(int=value)
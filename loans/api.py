@@ -1,6 +1,8 @@
+import uuid
 from decimal import Decimal
 from typing import List
 
+from asgiref.sync import sync_to_async
 from ninja import Router
 from aspireAPI.schemas import ErrorSchema
 
@@ -18,25 +20,78 @@ from .exceptions import LoanError
 router = Router()
 
 
+def loans_as_dicts(loans) -> List[dict]:
+    """
+    Build the LoanApplicationSchema data of the loans from plain rows,
+    without instantiating any model.
+    One query fetches the loans with their users, another their repayments
+    """
+    loan_rows = list(
+        loans.values(
+            "id",
+            "term",
+            "amount",
+            "date",
+            "state",
+            "user__id",
+            "user__email",
+            "user__first_name",
+            "user__last_name",
+            "_pending_amount",
+            "_pending_terms",
+        )
+    )
+
+    repayments = {row["id"]: [] for row in loan_rows}
+    repayment_rows = (
+        LoanRepayment.objects.filter(loan_id__in=repayments)
+        .order_by("state", "date_of_payment")
+        .values("id", "loan_id", "amount", "date_of_payment", "state")
+    )
+    for repayment in repayment_rows:
+        repayments[repayment.pop("loan_id")].append(repayment)
+
+    return [
+        {
+            "id": row["id"],
+            "term": row["term"],
+            "amount": row["amount"],
+            "date": row["date"],
+            "state": row["state"],
+            "user": {
+                "id": row["user__id"],
+                "email": row["user__email"],
+                "first_name": row["user__first_name"],
+                "last_name": row["user__last_name"],
+            },
+            "pending_amount": row["_pending_amount"],
+            "pending_terms": row["_pending_terms"],
+            "repayments": repayments[row["id"]],
+        }
+        for row in loan_rows
+    ]
+
+
 @router.get("", response={200: List[LoanApplicationSchema]})
-def get_loans(request):
+async def get_loans(request):
     """
     Endpoint to fetch all loans for a given user,
     or all loans if the user is Admin. Grouped by state
     """
-    if request.user.is_superuser:
-        return LoanApplication.objects.all()
+    loans = LoanApplication.objects.with_totals()
+    if not request.user.is_superuser:
+        loans = loans.filter(user=request.user).order_by("state")
 
-    return LoanApplication.objects.filter(user=request.user).order_by("state")
+    return await sync_to_async(loans_as_dicts)(loans)
 
 
 @router.get("{loan_id}", response={200: LoanApplicationSchema, 403: ErrorSchema})
-def get_loan(request, loan_id: str):
+async def get_loan(request, loan_id: uuid.UUID):
     """
     Endpoint to get information about a selected loan id
     """
-    loan = LoanApplication.objects.get(id=loan_id)
-    if not (request.user.is_superuser or request.user == loan.user):
+    loan = await LoanApplication.objects.for_api().aget(id=loan_id)
+    if not (request.user.is_superuser or request.user.id == loan.user_id):
         return 403, ErrorSchema(message="Unauthorized Access. Not enough permissions")
 
     return loan
@@ -71,8 +126,8 @@ def approve_or_reject_loan(request, loan_application: LoanApprovalSchema):
             message="Forbidden. You do not have permission for this operation"
         )
 
-    loan_object = LoanApplication.objects.get(id=loan_application.id)
-    loan_object.update_state_and_refresh_object(loan_application.state)
+    loan_object = LoanApplication.objects.for_api().get(id=loan_application.id)
+    loan_object.update_state(loan_application.state)
 
     return 200, loan_object
 
@@ -81,17 +136,18 @@ def approve_or_reject_loan(request, loan_application: LoanApprovalSchema):
     "payment/{repayment_id}",
     response={200: LoanRepaymentSchema, 400: ErrorSchema, 403: ErrorSchema},
 )
-def pay_amount(request, repayment_id: int, data: LoanRepaymentInputSchema):
+async def pay_amount(request, repayment_id: int, data: LoanRepaymentInputSchema):
     """
     Endpoint for customers to pay the term amount
     """
-    repayment_object = LoanRepayment.objects.get(id=repayment_id)
+    repayment_object = await LoanRepayment.objects.for_payment().aget(id=repayment_id)
 
     if repayment_object.loan.user != request.user:
         return 403, ErrorSchema(message="Authorization Error!")
 
     try:
-        repayment_object.make_payment(data.amount)
+        # Payment runs in a transaction, which needs a synchronous context
+        await sync_to_async(repayment_object.make_payment)(data.amount)
         return 200, repayment_object
     except (ValueError, LoanError) as exception:
         return 400, ErrorSchema(message=str(exception))
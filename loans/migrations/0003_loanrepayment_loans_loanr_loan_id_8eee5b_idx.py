@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-15 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="loanrepayment",
+            index=models.Index(
+                fields=["loan", "date_of_payment", "state"],
+                name="loans_loanr_loan_id_8eee5b_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-15 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0003_loanrepayment_loans_loanr_loan_id_8eee5b_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="loanapplication",
+            index=models.Index(
+                fields=["user", "state"], name="loans_loana_user_id_832fac_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loanrepayment",
+            index=models.Index(
+                fields=["loan", "state"], name="loans_loanr_loan_id_827992_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-15 11:02
+
+import aspireAPI.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0004_loanapplication_loans_loana_user_id_832fac_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="loanapplication",
+            name="id",
+            field=models.UUIDField(
+                default=aspireAPI.utils.time_ordered_uuid,
+                editable=False,
+                primary_key=True,
+                serialize=False,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-15 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0005_alter_loanapplication_id"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="loanrepayment",
+            constraint=models.CheckConstraint(
+                check=models.Q(("amount__gte", 0)), name="loan_repayment_amount_gte_0"
+            ),
+        ),
+    ]
@@ -1,14 +1,20 @@
 from datetime import date, datetime, timedelta
-from decimal import Decimal
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
 
 import uuid
-from typing import List
-from django.contrib.auth import get_user_model
+from typing import List, Tuple
+from django.conf import settings
 from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from aspireAPI.utils import time_ordered_uuid
 
 from .exceptions import LoanNotApprovedError, LoanRepaymentComplete, PaymentPendingError
 
 LOWER_LOAN_LIMIT = Decimal(100.00)
+REPAYMENT_PRECISION = Decimal("0.01")
+REPAYMENT_INTERVAL = timedelta(days=7)
 
 
 class LoanState(models.TextChoices):
@@ -33,15 +39,70 @@ class LoanRepaymentState(models.TextChoices):
     PAID = "PAID", "PAID"
 
 
+# Repayment states bound once for the comparisons and filters on the payment path
+PAID_STATE = LoanRepaymentState.PAID
+PENDING_STATE = LoanRepaymentState.PENDING
+
+
+class LoanApplicationQuerySet(models.QuerySet):
+    """
+    QuerySet for Loan Applications, with the query shapes used by the API
+    """
+
+    def with_totals(self) -> "LoanApplicationQuerySet":
+        """
+        Return the loans annotated with their pending amount and no of pending terms,
+        which pending_amount and pending_terms then read without further queries
+        """
+        return self.annotate(
+            _pending_amount=models.F("amount")
+            - Coalesce(
+                models.Sum(
+                    "repayments__amount", filter=models.Q(repayments__state=PAID_STATE)
+                ),
+                models.Value(Decimal("0")),
+            ),
+            _pending_terms=models.Count(
+                "repayments", filter=models.Q(repayments__state=PENDING_STATE)
+            ),
+        )
+
+    def for_api(self) -> "LoanApplicationQuerySet":
+        """
+        Return the loans with everything LoanApplicationSchema reads loaded up front:
+        the user, the repayments and the pending amount/terms.
+        Only the columns exposed by the schemas are fetched
+        """
+        repayments = LoanRepayment.objects.only(
+            "id", "loan", "amount", "date_of_payment", "state"
+        ).order_by("state", "date_of_payment")
+        return (
+            self.with_totals()
+            .select_related("user")
+            .only(
+                "id",
+                "term",
+                "amount",
+                "date",
+                "state",
+                "user__id",
+                "user__email",
+                "user__first_name",
+                "user__last_name",
+            )
+            .prefetch_related(models.Prefetch("repayments", queryset=repayments))
+        )
+
+
 class LoanApplication(models.Model):
     """
     Model for Loan Application of a User
     Foreign Key: User
     """
 
-    id = models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True)
+    id = models.UUIDField(default=time_ordered_uuid, editable=False, primary_key=True)
     user = models.ForeignKey(
-        get_user_model(), related_name="applications", on_delete=models.CASCADE
+        settings.AUTH_USER_MODEL, related_name="applications", on_delete=models.CASCADE
     )
     term = models.PositiveIntegerField(null=False, blank=False)
     amount = models.DecimalField(
@@ -55,9 +116,12 @@ class LoanApplication(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = LoanApplicationQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Loan Application"
         verbose_name_plural = "Loan Applications"
+        indexes = [models.Index(fields=["user", "state"])]
 
     def __str__(self) -> str:
         return f"{self.user} - {self.amount} - {self.get_state_display()}"
@@ -66,9 +130,14 @@ class LoanApplication(models.Model):
     def pending_amount(self) -> Decimal:
         """
         Return the pending amount for loan, i.e., amount not paid yet
+        Uses the value annotated by with_totals when available
         """
-        paid_amount: Decimal = (
-            self.repayments.filter(state=LoanRepaymentState.PAID)
+        pending_amount = getattr(self, "_pending_amount", None)
+        if pending_amount is not None:
+            return pending_amount
+
+        paid_amount = (
+            self.repayments.filter(state=PAID_STATE)
             .aggregate(models.Sum("amount"))
             .get("amount__sum")
         )
@@ -78,15 +147,23 @@ class LoanApplication(models.Model):
     def pending_terms(self) -> int:
         """
         Return the no of pending terms for the loan
+        Uses the value annotated by with_totals when available
         """
-        return self.repayments.filter(state=LoanRepaymentState.PENDING).count()
+        pending_terms = getattr(self, "_pending_terms", None)
+        if pending_terms is not None:
+            return pending_terms
+
+        return self.repayments.filter(state=PENDING_STATE).count()
 
     def update_state(self, state: str):
         """
         Update the state of loan according to the input provided
+        Only the state and updated_at columns are written
         """
+        updated_at = timezone.now()
+        type(self).objects.filter(pk=self.pk).update(state=state, updated_at=updated_at)
         self.state = state
-        self.save()
+        self.updated_at = updated_at
 
     def update_as_paid(self):
         """
@@ -96,10 +173,30 @@ class LoanApplication(models.Model):
 
     def update_state_and_refresh_object(self, state: str):
         """
-        Update the state of the loan and return the object from the database
+        Update the state of the loan, keeping the object in sync
+        update_state already sets the new state on the object, no need to refresh it
         """
         self.update_state(state)
-        self.refresh_from_db()
+
+
+class LoanRepaymentQuerySet(models.QuerySet):
+    """
+    QuerySet for Loan Repayments, with the query shapes used by the API
+    """
+
+    def for_payment(self) -> "LoanRepaymentQuerySet":
+        """
+        Return the repayments with what make_payment checks loaded up front:
+        the loan and its user, and whether an earlier repayment is still pending
+        """
+        prior_pending = self.model.objects.filter(
+            loan=models.OuterRef("loan"),
+            state=PENDING_STATE,
+            date_of_payment__lt=models.OuterRef("date_of_payment"),
+        )
+        return self.select_related("loan", "loan__user").annotate(
+            _prior_pending=models.Exists(prior_pending)
+        )
 
 
 class LoanRepayment(models.Model):
@@ -120,13 +217,61 @@ class LoanRepayment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = LoanRepaymentQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Loan Repayment"
         verbose_name_plural = "Loan Repayments"
+        indexes = [
+            models.Index(fields=["loan", "state"]),
+            models.Index(fields=["loan", "date_of_payment", "state"]),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(amount__gte=0), name="loan_repayment_amount_gte_0"
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.id} - {self.amount}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Keep track of the amount loaded from the database,
+        so that save can compare against it without re-fetching the row
+        """
+        instance = super().from_db(db, field_names, values)
+        if "amount" in field_names:
+            instance._loaded_amount = instance.amount
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        """
+        Keep the tracked amount in sync with the refreshed row
+        """
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or "amount" in fields:
+            if "amount" in self.get_deferred_fields():
+                self._loaded_amount = None
+            else:
+                self._loaded_amount = self.amount
+
+    @classmethod
+    def loan_state_snapshot(cls, loan: LoanApplication) -> Tuple[Decimal, int]:
+        """
+        Return the pending amount and the no of pending terms of the loan
+        Both are computed in a single aggregate query
+        """
+        snapshot = loan.repayments.aggregate(
+            paid=Coalesce(
+                models.Sum("amount", filter=models.Q(state=PAID_STATE)),
+                models.Value(Decimal("0")),
+            ),
+            pending=models.Count("id", filter=models.Q(state=PENDING_STATE)),
+        )
+        return loan.amount - snapshot["paid"], snapshot["pending"]
+
     def save(self, *args, **kwargs):
         """
         Overriding default save functionality for the model
@@ -135,120 +280,159 @@ class LoanRepayment(models.Model):
 
         if not self.pk:
             # object creation, no change needed
-            return super().save(*args, **kwargs)
+            return self._save(*args, **kwargs)
+
+        old_amount = getattr(self, "_loaded_amount", None)
+        if old_amount is None:
+            old_amount = LoanRepayment.objects.values_list("amount", flat=True).get(
+                pk=self.pk
+            )
 
-        old_data = LoanRepayment.objects.get(pk=self.pk)
-        if self.amount < old_data.amount:
+        if self.amount < old_amount:
             raise ValueError(
                 "Amount Paid should be greater than or equal to Payment amount"
             )
 
-        if self.amount > self.loan.pending_amount:
+        pending_amount, pending_terms = LoanRepayment.loan_state_snapshot(self.loan)
+        if self.amount > pending_amount:
             raise ValueError("Amount Paid is more than Loan amount")
 
-        pending_loan_terms = self.loan.pending_terms - 1
+        # Round to cents like the database column (half away from zero),
+        # so the object needs no refresh after saving
+        self.amount = Decimal(self.amount).quantize(
+            REPAYMENT_PRECISION, rounding=ROUND_HALF_UP
+        )
 
-        if pending_loan_terms == 0:
-            with transaction.atomic():
-                self.state = LoanRepaymentState.PAID
-                super().save(*args, **kwargs)
+        pending_loan_terms = pending_terms - 1
+
+        if pending_loan_terms == 0 or self.amount == pending_amount:
+            with transaction.atomic(savepoint=False):
+                self.state = PAID_STATE
+                self._save(*args, **kwargs)
+                if pending_loan_terms:
+                    # Payment settles the loan, close the other repayments at once
+                    self.loan.repayments.filter(state=PENDING_STATE).exclude(
+                        id=self.pk
+                    ).update(
+                        state=PAID_STATE, amount=Decimal("0"), updated_at=timezone.now()
+                    )
                 return self.loan.update_as_paid()
 
-        if self.amount == old_data.amount:
+        if self.amount == old_amount:
             # No change in repayment amount
-            self.state = LoanRepaymentState.PAID
-            return super().save(*args, **kwargs)
+            self.state = PAID_STATE
+            return self._save(*args, **kwargs)
 
         # Amount Paid > Repayment amount, distribute the other Repayments
-        pending_loan_amount = self.loan.pending_amount - self.amount
-        repayments_pending = list(
-            self.loan.repayments.filter(state=LoanRepaymentState.PENDING).exclude(
-                id=self.pk
-            )
+        repayment_amount, last_repayment_amount = split_amount(
+            pending_amount - self.amount, pending_loan_terms
         )
-        repayments_pending = split_amount_for_excess_payment(
-            pending_loan_amount, pending_loan_terms, repayments_pending
+        repayments_pending = self.loan.repayments.filter(state=PENDING_STATE).exclude(
+            id=self.pk
         )
-        with transaction.atomic():
-            self.state = LoanRepaymentState.PAID
-            super().save(*args, **kwargs)
-            LoanRepayment.objects.bulk_update(repayments_pending, fields=["amount"])
+        last_repayment = repayments_pending.order_by("-date_of_payment", "-id")[:1]
+        with transaction.atomic(savepoint=False):
+            self.state = PAID_STATE
+            self._save(*args, **kwargs)
+            # Single UPDATE, the last repayment absorbs any rounding difference
+            repayments_pending.update(
+                amount=models.Case(
+                    models.When(
+                        id=models.Subquery(last_repayment.values("id")),
+                        then=models.Value(last_repayment_amount),
+                    ),
+                    default=models.Value(repayment_amount),
+                )
+            )
 
         return None
 
+    def _save(self, *args, **kwargs):
+        """
+        Save the object and remember the amount now stored in the database
+        """
+        super().save(*args, **kwargs)
+        self._loaded_amount = self.amount
+
     def check_validity_for_payment(self):
         """
         Checks before accepting user payment for loan
         """
-        if self.state == LoanRepaymentState.PAID:
+        if self.state == PAID_STATE:
             raise LoanRepaymentComplete("Repayment is complete. No need to pay again!")
 
         if not self.loan.state == LoanState.APPROVED:
             raise LoanNotApprovedError("Cannot Repay an unapproved loan")
 
-        if self.loan.repayments.filter(
-            date_of_payment__lt=self.date_of_payment
-        ).exists():
+        if self.has_prior_pending_repayment():
             raise PaymentPendingError(
                 "Error! Skipping Prior payment. Please pay earlier payments first"
             )
 
+    def has_prior_pending_repayment(self) -> bool:
+        """
+        Check if any earlier repayment of the loan is still pending
+        Uses the value annotated by for_payment or
+        the loan's prefetched repayments when available
+        """
+        prior_pending = getattr(self, "_prior_pending", None)
+        if prior_pending is not None:
+            return prior_pending
+
+        if "repayments" in getattr(self.loan, "_prefetched_objects_cache", {}):
+            return any(
+                repayment.state == PENDING_STATE
+                and repayment.date_of_payment < self.date_of_payment
+                for repayment in self.loan.repayments.all()
+            )
+
+        return self.loan.repayments.filter(
+            state=PENDING_STATE, date_of_payment__lt=self.date_of_payment
+        ).exists()
+
     def make_payment(self, amount: Decimal):
         """
         Method to save the payment to the loan
+        The checks and all the writes of the payment run in a single transaction,
+        with the repayment row locked and its state and amount read again
         """
-        self.check_validity_for_payment()
-        self.amount = amount
-        self.save()
-        self.refresh_from_db()
+        with transaction.atomic():
+            row = type(self).objects.select_for_update().filter(pk=self.pk)
+            self.state, self._loaded_amount = row.values_list("state", "amount").get()
+            self.check_validity_for_payment()
+            self.amount = amount
+            self.save()
         return self
 
 
-def add_remaining_amount_to_last_repayment(
-    repayments: List[LoanRepayment], amount: Decimal, repayment_amount: Decimal
-) -> None:
-    # Calculate any remaining amount and add it to the last repayment
-    remaining_amount = amount - (repayments[0].amount * Decimal(len(repayments)))
-    last_repayment = repayments[-1]
-    last_repayment.amount += remaining_amount
-
-
-def split_amount_for_excess_payment(
-    amount: Decimal, num_terms: int, repayments: List[LoanRepayment]
-) -> List[LoanRepayment]:
+def split_amount(amount: Decimal, num_terms: int) -> Tuple[Decimal, Decimal]:
     """
-    Divide the amount of loan into equal repayments and
-    prevent any rounding error
+    Divide the amount into equal repayments rounded down to cents
+    Returns the amount of each repayment and of the last repayment,
+    which takes up the remainder and so is never negative
     """
-
-    repayment_amount = amount / Decimal(num_terms)
-
-    for obj in repayments:
-        obj.amount = Decimal(round(repayment_amount, 2))
-
-    add_remaining_amount_to_last_repayment(repayments, amount, repayment_amount)
-    return repayments
+    repayment_amount = (amount / Decimal(num_terms)).quantize(
+        REPAYMENT_PRECISION, rounding=ROUND_DOWN
+    )
+    return repayment_amount, amount - repayment_amount * (num_terms - 1)
 
 
 def split_amount_for_new_loan(
-    amount: Decimal, num_terms: int, start_date: date
+    amount: Decimal, num_terms: int, start_date: date, loan_id: uuid.UUID
 ) -> List[LoanRepayment]:
     """
     Divide the amount of loan into equal repayments and
     prevent any rounding error
+    The repayments are built for the loan with the given id
     """
 
-    repayment_amount = amount / Decimal(num_terms)
-    repayments = [
+    repayment_amount, last_repayment_amount = split_amount(amount, num_terms)
+    return [
         LoanRepayment(
-            amount=Decimal(round(repayment_amount, 2)),
-            state=LoanRepaymentState.PENDING,
-            date_of_payment=start_date + timedelta(days=7 * (i + 1)),
+            loan_id=loan_id,
+            amount=last_repayment_amount if term == num_terms else repayment_amount,
+            state=PENDING_STATE,
+            date_of_payment=start_date + REPAYMENT_INTERVAL * term,
         )
-        for i in range(num_terms)
+        for term in range(1, num_terms + 1)
     ]
-
-    # Calculate any remaining amount and add it to the last repayment
-    add_remaining_amount_to_last_repayment(repayments, amount, repayment_amount)
-
-    return repayments
@@ -54,7 +54,7 @@ class LoanApplicationSchema(ModelSchema):
         model_fields = ["id", "term", "amount", "date", "state", "user"]
 
     def resolve_repayments(self, obj):
-        return obj.repayments.all().order_by("state")
+        return obj.repayments.all()
 
 
 class LoanApprovalSchema(ModelSchema):
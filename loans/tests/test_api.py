@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 from django.test import TestCase, Client
@@ -27,11 +27,94 @@ class TestLoanAPIs(TestCase):
             _quantity=3,
         )
         self.client.force_login(self.user)
-        response = self.client.get("/api/loans/", format="json")
+        # Session and user, then the loans and their repayments
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/loans/", format="json")
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 5)
 
+    def test_get_loans_payload(self):
+        """
+        Test the loans listed for a user carry their totals, user and
+        their own repayments, paid first then by date of payment
+        """
+        loan = baker.make(
+            LoanApplication,
+            user=self.user,
+            amount=Decimal("1000"),
+            term=3,
+            state=LoanState.APPROVED,
+        )
+        other_loan = baker.make(
+            LoanApplication, user=self.user, state=LoanState.PENDING
+        )
+        today = date.today()
+        last = baker.make(
+            LoanRepayment,
+            loan=loan,
+            amount=Decimal("333.34"),
+            state=LoanRepaymentState.PENDING,
+            date_of_payment=today + timedelta(days=14),
+        )
+        second = baker.make(
+            LoanRepayment,
+            loan=loan,
+            amount=Decimal("333.33"),
+            state=LoanRepaymentState.PENDING,
+            date_of_payment=today + timedelta(days=7),
+        )
+        first = baker.make(
+            LoanRepayment,
+            loan=loan,
+            amount=Decimal("333.33"),
+            state=LoanRepaymentState.PAID,
+            date_of_payment=today,
+        )
+        baker.make(
+            LoanRepayment,
+            loan=other_loan,
+            state=LoanRepaymentState.PENDING,
+            date_of_payment=today,
+        )
+
+        self.client.force_login(self.user)
+        response = self.client.get("/api/loans/", format="json")
+
+        self.assertEqual(response.status_code, 200)
+        loans = {row["id"]: row for row in response.json()}
+        payload = loans[str(loan.id)]
+        self.assertEqual(payload["amount"], "1000.00")
+        self.assertEqual(payload["state"], LoanState.APPROVED)
+        self.assertEqual(payload["pending_amount"], "666.67")
+        self.assertEqual(payload["pending_terms"], 2)
+        self.assertEqual(
+            payload["user"],
+            {
+                "id": str(self.user.id),
+                "email": self.user.email,
+                "first_name": self.user.first_name,
+                "last_name": self.user.last_name,
+            },
+        )
+        self.assertEqual(
+            payload["repayments"],
+            [
+                {
+                    "id": repayment.id,
+                    "amount": amount,
+                    "date_of_payment": repayment.date_of_payment.isoformat(),
+                    "state": repayment.state,
+                }
+                for repayment, amount in [
+                    (first, "333.33"),
+                    (second, "333.33"),
+                    (last, "333.34"),
+                ]
+            ],
+        )
+        self.assertEqual(len(loans[str(other_loan.id)]["repayments"]), 1)
+
     def test_get_all_loans_for_admin(self):
         """
         Test API to get all loan applications for the Admin user
@@ -44,7 +127,9 @@ class TestLoanAPIs(TestCase):
         baker.make(LoanApplication, user=admin, state="NEW", _quantity=1)
 
         self.client.force_login(admin)
-        response = self.client.get("/api/loans/", content_type="application/json")
+        # Session and user, then the loans and their repayments
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/loans/", content_type="application/json")
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 6)
 
@@ -54,7 +139,9 @@ class TestLoanAPIs(TestCase):
         """
         loan = baker.make(LoanApplication, user=self.user, state=LoanState.PENDING)
         self.client.force_login(self.user)
-        response = self.client.get(f"/api/loans/{loan.id}", format="json")
+        # Session and user, then the loan and its repayments
+        with self.assertNumQueries(4):
+            response = self.client.get(f"/api/loans/{loan.id}", format="json")
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()["id"], str(loan.id))
 
@@ -135,6 +222,8 @@ class TestLoanAPIs(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()["state"], LoanState.APPROVED)
+        loan.refresh_from_db()
+        self.assertEqual(loan.state, LoanState.APPROVED)
 
     def test_reject_loan_as_admin(self):
         """
@@ -238,3 +327,17 @@ class PayAmountTestCase(TestCase):
             "Amount Paid is more than Loan amount",
             response.json()["message"],
         )
+
+    def test_payment_amount_out_of_range(self):
+        """
+        Test endpoint by paying an amount too large to round to cents
+        """
+        self.client.force_login(user=self.user)
+        response = self.client.put(
+            self.url, data={"amount": 1e30}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(
+            "Amount Paid is more than Loan amount",
+            response.json()["message"],
+        )
@@ -1,6 +1,9 @@
+import uuid
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 
+from django.db import transaction
+from django.db.utils import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from model_bakery import baker
@@ -10,7 +13,7 @@ from loans.models import (
     LoanState,
     LoanRepayment,
     LoanRepaymentState,
-    split_amount_for_excess_payment,
+    split_amount,
     split_amount_for_new_loan,
 )
 from loans.exceptions import (
@@ -20,6 +23,13 @@ from loans.exceptions import (
 )
 
 
+def bulk_bake(model, quantity, **attrs):
+    """
+    Prepare the objects with model_bakery and insert them in a single query
+    """
+    return model.objects.bulk_create(baker.prepare(model, _quantity=quantity, **attrs))
+
+
 class LoanApplicationTestCase(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -53,8 +63,18 @@ class LoanApplicationTestCase(TestCase):
             state=LoanRepaymentState.PAID,
         )
 
-        # Assert pending_amount equals the remaining amount
-        self.assertEqual(self.test_loan_application.pending_amount, Decimal("400.00"))
+        # Assert pending_amount equals the remaining amount, with one aggregate query
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.test_loan_application.pending_amount, Decimal("400.00")
+            )
+
+        # Assert the annotated pending_amount matches and needs no extra query
+        loan = LoanApplication.objects.with_totals().get(
+            pk=self.test_loan_application.pk
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(loan.pending_amount, Decimal("400.00"))
 
     def test_pending_terms(self):
         """
@@ -77,18 +97,55 @@ class LoanApplicationTestCase(TestCase):
             state=LoanRepaymentState.PENDING,
         )
 
-        # Assert pending_terms equals the number of pending repayments
-        self.assertEqual(self.test_loan_application.pending_terms, 2)
+        # Assert pending_terms equals the number of pending repayments, with one query
+        with self.assertNumQueries(1):
+            self.assertEqual(self.test_loan_application.pending_terms, 2)
+
+        # Assert the annotated pending_terms matches and needs no extra query
+        loan = LoanApplication.objects.with_totals().get(
+            pk=self.test_loan_application.pk
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(loan.pending_terms, 2)
+
+    def test_for_api(self):
+        """
+        Test for_api loads the user, repayments and totals of the loan up front
+        """
+        baker.make(
+            LoanRepayment,
+            loan=self.test_loan_application,
+            amount=100,
+            date_of_payment=datetime.now().date() - timedelta(days=1),
+            state=LoanRepaymentState.PAID,
+        )
+
+        # One query for the loan with its user and totals, one for the repayments
+        with self.assertNumQueries(2):
+            loan = LoanApplication.objects.for_api().get(
+                pk=self.test_loan_application.pk
+            )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(loan.user, self.test_user)
+            self.assertEqual(len(loan.repayments.all()), 1)
+            self.assertEqual(loan.pending_amount, Decimal("400.00"))
+            self.assertEqual(loan.pending_terms, 0)
 
     def test_update_state(self):
         """
         Test update_state method of LoanApplication model
         """
-        # Update loan state to "APPROVED"
-        self.test_loan_application.update_state(LoanState.APPROVED)
+        # Update loan state to "APPROVED", as a single UPDATE query
+        with self.assertNumQueries(1):
+            self.test_loan_application.update_state(LoanState.APPROVED)
 
-        # Assert loan state is "APPROVED"
+        # Assert loan state is "APPROVED", in memory and in the database
         self.assertEqual(self.test_loan_application.state, LoanState.APPROVED)
+        self.assertEqual(
+            LoanApplication.objects.get(pk=self.test_loan_application.pk).state,
+            LoanState.APPROVED,
+        )
 
     def test_update_as_paid(self):
         """
@@ -113,24 +170,28 @@ class LoanApplicationTestCase(TestCase):
         """
         Test update_state_and_refresh_object method of LoanApplication model
         """
-        # Update loan state to "REJECTED"
-        self.test_loan_application.update_state_and_refresh_object(LoanState.REJECTED)
+        # Update loan state to "REJECTED", no refresh query needed
+        with self.assertNumQueries(1):
+            self.test_loan_application.update_state_and_refresh_object(
+                LoanState.REJECTED
+            )
 
         self.assertEqual(self.test_loan_application.state, LoanState.REJECTED)
 
 
 class LoanRepaymentTestCase(TestCase):
-    def setUp(self):
-        self.loan = baker.make(
+    @classmethod
+    def setUpTestData(cls):
+        cls.loan = baker.make(
             LoanApplication,
             amount=Decimal("1000"),
             term=5,
             state=LoanState.APPROVED,
         )
-        self.repayment = baker.make(
+        cls.repayment = bulk_bake(
             LoanRepayment,
-            self.loan.term,
-            loan=self.loan,
+            cls.loan.term,
+            loan=cls.loan,
             amount=Decimal("200"),
             state=LoanRepaymentState.PENDING,
             date_of_payment=date.today(),
@@ -162,12 +223,97 @@ class LoanRepaymentTestCase(TestCase):
         """
         Test making a payment for a loan repayment
         """
-        self.repayment.make_payment(Decimal("200"))
-        self.assertEqual(self.repayment.state, LoanRepaymentState.PAID)
-        self.assertEqual(self.repayment.amount, Decimal("200"))
+        repayment = LoanRepayment.objects.for_payment().get(pk=self.repayment.pk)
+
+        # Savepoint, row lock, pending totals aggregate, repayment UPDATE, release
+        with self.assertNumQueries(5):
+            repayment.make_payment(Decimal("200"))
+
+        self.assertEqual(repayment.state, LoanRepaymentState.PAID)
+        self.assertEqual(repayment.amount, Decimal("200"))
         self.assertEqual(self.loan.pending_amount, Decimal("800"))
         self.assertEqual(self.loan.pending_terms, 4)
 
+    def test_save_after_refresh_from_db(self):
+        """
+        Test saving compares against the amount read by refresh_from_db
+        """
+        LoanRepayment.objects.filter(pk=self.repayment.pk).update(amount=Decimal("600"))
+        self.repayment.refresh_from_db()
+        self.repayment.amount = Decimal("550")
+        self.assertRaises(ValueError, self.repayment.save)
+
+    def test_make_payment_excess_redistribution(self):
+        """
+        Test an excess payment is spread over the other pending repayments,
+        the last one taking the rounding remainder
+        """
+        loan = baker.make(
+            LoanApplication,
+            amount=Decimal("1000"),
+            term=4,
+            state=LoanState.APPROVED,
+        )
+        repayments = [
+            baker.make(
+                LoanRepayment,
+                loan=loan,
+                amount=Decimal("250"),
+                state=LoanRepaymentState.PENDING,
+                date_of_payment=date.today() + timedelta(days=7 * term),
+            )
+            for term in range(4)
+        ]
+
+        repayments[0].make_payment(Decimal("300"))
+
+        pending = loan.repayments.filter(state=LoanRepaymentState.PENDING)
+        self.assertEqual(
+            list(pending.order_by("date_of_payment").values_list("amount", flat=True)),
+            [Decimal("233.33"), Decimal("233.33"), Decimal("233.34")],
+        )
+
+    def test_make_payment_small_remainder_over_many_terms(self):
+        """
+        Test an excess payment leaving less than a cent per repayment
+        puts the whole remainder on the last one, never a negative amount
+        """
+        loan = baker.make(
+            LoanApplication,
+            amount=Decimal("1000"),
+            term=21,
+            state=LoanState.APPROVED,
+        )
+        repayment = bulk_bake(
+            LoanRepayment,
+            loan.term,
+            loan=loan,
+            amount=Decimal("47.62"),
+            state=LoanRepaymentState.PENDING,
+            date_of_payment=date.today(),
+        )[0]
+
+        repayment.make_payment(Decimal("999.85"))
+
+        amounts = loan.repayments.filter(state=LoanRepaymentState.PENDING).values_list(
+            "amount", flat=True
+        )
+        self.assertEqual(sorted(amounts), [Decimal("0.00")] * 19 + [Decimal("0.15")])
+
+    def test_make_payment_settling_loan(self):
+        """
+        Test paying the whole pending amount closes the loan and its other repayments
+        """
+        self.repayment.make_payment(Decimal("1000"))
+
+        self.assertEqual(self.repayment.state, LoanRepaymentState.PAID)
+        self.assertFalse(
+            self.loan.repayments.filter(state=LoanRepaymentState.PENDING).exists()
+        )
+        self.assertEqual(self.loan.pending_amount, Decimal("0"))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.state, LoanState.PAID)
+
     def test_check_validity_for_payment(self):
         """
         Test checking validity for loan repayment payment
@@ -195,17 +341,18 @@ class LoanRepaymentTestCase(TestCase):
 
 
 class LoanRepaymentTestCaseNegative(TestCase):
-    def setUp(self):
-        self.loan = baker.make(
+    @classmethod
+    def setUpTestData(cls):
+        cls.loan = baker.make(
             LoanApplication,
             amount=Decimal("1000"),
             term=5,
             state=LoanState.APPROVED,
         )
-        self.repayment = baker.make(
+        cls.repayment = bulk_bake(
             LoanRepayment,
-            self.loan.term,
-            loan=self.loan,
+            cls.loan.term,
+            loan=cls.loan,
             amount=Decimal("200"),
             state=LoanRepaymentState.PENDING,
             date_of_payment=date.today(),
@@ -218,11 +365,23 @@ class LoanRepaymentTestCaseNegative(TestCase):
         self.repayment.amount = Decimal("100")
         self.assertRaises(ValueError, self.repayment.save)
 
+    def test_loan_repayment_negative_amount(self):
+        """
+        Test the database rejects a loan repayment with a negative amount
+        """
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LoanRepayment.objects.filter(id=self.repayment.id).update(
+                amount=Decimal("-1")
+            )
+
     def test_make_payment_invalid_repayment(self):
         """
         Test making a payment for an invalid loan repayment
+        The state is read again from the database, the object may be stale
         """
-        self.repayment.state = LoanRepaymentState.PAID
+        LoanRepayment.objects.filter(pk=self.repayment.pk).update(
+            state=LoanRepaymentState.PAID
+        )
         self.assertRaises(
             LoanRepaymentComplete, self.repayment.make_payment, Decimal("200")
         )
@@ -249,31 +408,32 @@ class LoanRepaymentTestCaseNegative(TestCase):
             PaymentPendingError, next_repayment.make_payment, Decimal("200")
         )
 
-    def test_split_amount_for_excess_payment(self):
+        # Same check answered by the for_payment annotation, without a query
+        next_repayment = LoanRepayment.objects.for_payment().get(pk=next_repayment.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(next_repayment.has_prior_pending_repayment())
+
+    def test_split_amount(self):
         """
-        Test splitting the amount for excess payment
+        Test splitting an amount, the last repayment taking the rounding remainder
         """
-        repayments = baker.make(
-            LoanRepayment,
-            _quantity=3,
-            loan=self.loan,
-            amount=Decimal("100"),
-            state=LoanRepaymentState.PENDING,
+        self.assertEqual(
+            split_amount(Decimal("1000"), 3), (Decimal("333.33"), Decimal("333.34"))
         )
-        repayments_pending = split_amount_for_excess_payment(
-            Decimal("400"), 4, repayments
+        self.assertEqual(
+            split_amount(Decimal("0.15"), 20), (Decimal("0.00"), Decimal("0.15"))
         )
-        self.assertEqual(len(repayments_pending), 3)
-        self.assertEqual(repayments_pending[0].amount, Decimal("100"))
-        self.assertEqual(repayments_pending[1].amount, Decimal("100"))
-        self.assertEqual(repayments_pending[2].amount, Decimal("200"))
 
     def test_split_amount_for_new_loan(self):
         """
         Test splitting the amount for a new loan
         """
-        repayments = split_amount_for_new_loan(Decimal("1000"), 5, date.today())
+        loan_id = uuid.uuid4()
+        repayments = split_amount_for_new_loan(
+            Decimal("1000"), 5, date.today(), loan_id=loan_id
+        )
         self.assertEqual(len(repayments), 5)
+        self.assertTrue(all(repayment.loan_id == loan_id for repayment in repayments))
         self.assertEqual(repayments[0].amount, Decimal("200"))
         self.assertEqual(repayments[1].amount, Decimal("200"))
         self.assertEqual(repayments[2].amount, Decimal("200"))
@@ -22,15 +22,15 @@ def create_new_loan(
     if loan_application.amount < LOWER_LOAN_LIMIT:
         raise ValueError("Loan Amount Requested is too low")
 
-    repayments: List[LoanRepayment] = split_amount_for_new_loan(
-        loan_application.amount, loan_application.term, loan_application.date
-    )
-
     with transaction.atomic():
         loan_object = LoanApplication.objects.create(
             user=user, **loan_application.dict()
         )
-        for repayment in repayments:
-            repayment.loan = loan_object
-        LoanRepayment.objects.bulk_create(repayments)
+        repayments: List[LoanRepayment] = split_amount_for_new_loan(
+            loan_application.amount,
+            loan_application.term,
+            loan_application.date,
+            loan_id=loan_object.pk,
+        )
+        LoanRepayment.objects.bulk_create(repayments, batch_size=500)
         return loan_object
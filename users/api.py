@@ -13,8 +13,15 @@ router = Router()
 def me(request):
     """
     Get details of the current user
+    Built as a dict, so the response skips the attribute lookups on the model
     """
-    return 200, request.user
+    user = request.user
+    return 200, {
+        "id": user.id,
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+    }
 
 
 @router.post("", response={201: UserSchema, 400: ErrorSchema}, auth=None)
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+
+UserModel = get_user_model()
+
+# Columns needed to check the credentials and log the user in
+AUTHENTICATION_FIELDS = ["id", "email", "password", "is_active"]
+
+# Columns never read from the user of the request. The password stays loaded,
+# the session hash check of every request is computed from it
+REQUEST_USER_DEFERRED_FIELDS = ["last_login", "created_at"]
+
+
+class UserBackend(ModelBackend):
+    """
+    Authentication backend for the User model.
+    Same as Django's ModelBackend, but only fetches the columns
+    needed to authenticate the user and to load the user of a request.
+    A failed login raises PermissionDenied, which stops Django from
+    hashing the password again in the backends listed after this one
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.only(*AUTHENTICATION_FIELDS).get(
+                **{UserModel.USERNAME_FIELD: username}
+            )
+        except UserModel.DoesNotExist:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user
+            UserModel().set_password(password)
+            raise PermissionDenied
+
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        raise PermissionDenied
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.defer(*REQUEST_USER_DEFERRED_FIELDS).get(
+                pk=user_id
+            )
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
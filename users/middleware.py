@@ -0,0 +1,34 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth.middleware import get_user
+
+# Paths served by async endpoints. Any other request keeps the lazy user
+LOAD_USER_PATH_PREFIXES = ("/api/loans/",)
+
+
+class LoadUserMiddleware:
+    """
+    Middleware to load the user of the request before an async endpoint is called.
+    AuthenticationMiddleware sets request.user lazily, and resolving it needs
+    database queries which are not allowed inside the async endpoints.
+    Under ASGI the user is loaded in a thread, without leaving the event loop
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path_info.startswith(LOAD_USER_PATH_PREFIXES):
+            request.user = get_user(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path_info.startswith(LOAD_USER_PATH_PREFIXES):
+            request.user = await sync_to_async(get_user)(request)
+        return await self.get_response(request)
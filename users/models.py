@@ -1,11 +1,16 @@
-import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
 from django.db import models
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 
+from aspireAPI.utils import time_ordered_uuid
+
 
 class UserManager(BaseUserManager):
     """
@@ -24,6 +29,29 @@ class UserManager(BaseUserManager):
         user.save(using=self.db)
         return user
 
+    def bulk_create_users(
+        self, users_data: Iterable[Dict], batch_size: int = 1000
+    ) -> List["User"]:
+        """
+        Creates and saves Users in bulk from dicts of email, first name, last name,
+        and password. The passwords are hashed concurrently, hashlib releases the GIL
+        while hashing, and the users are inserted with bulk_create.
+        """
+        users_data = list(users_data)
+        with ThreadPoolExecutor() as executor:
+            passwords = list(
+                executor.map(
+                    make_password, (data.get("password") for data in users_data)
+                )
+            )
+
+        users = []
+        for data, password in zip(users_data, passwords):
+            fields = {key: value for key, value in data.items() if key != "password"}
+            fields["email"] = self.normalize_email(fields["email"])
+            users.append(self.model(password=password, **fields))
+        return self.bulk_create(users, batch_size=batch_size)
+
     def create_superuser(
         self, email, first_name="", last_name="", password=None, **extra_fields
     ):
@@ -41,7 +69,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     Email is used as username for the user.
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=time_ordered_uuid, editable=False)
     first_name = models.CharField(max_length=150, blank=True)
     last_name = models.CharField(max_length=150, blank=True)
     email = models.EmailField(unique=True, db_index=True, blank=False, null=False)
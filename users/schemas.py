@@ -1,4 +1,6 @@
-from ninja import ModelSchema
+from ninja import ModelSchema, Schema
+from pydantic import Extra, constr
+
 from .models import User
 
 
@@ -12,21 +14,28 @@ class UserSchema(ModelSchema):
         model_fields = ["id", "email", "first_name", "last_name"]
 
 
-class UserInSchema(ModelSchema):
+class UserInSchema(Schema):
     """
     User Input schema containing password field too
+    Fields are declared explicitly instead of being derived from the model
     """
 
+    email: constr(strip_whitespace=True, max_length=254)
+    first_name: constr(strip_whitespace=True, max_length=150) = ""
+    last_name: constr(strip_whitespace=True, max_length=150) = ""
+    password: constr(max_length=128)
+
     class Config:
-        model = User
-        model_fields = ["email", "first_name", "last_name", "password"]
+        extra = Extra.forbid
 
 
-class LoginSchema(ModelSchema):
+class LoginSchema(Schema):
     """
     User Input Schema for login to the system
     """
 
+    email: constr(strip_whitespace=True, max_length=254)
+    password: constr(max_length=128)
+
     class Config:
-        model = User
-        model_fields = ["email", "password"]
+        extra = Extra.forbid
@@ -5,16 +5,19 @@ from users.models import User
 
 
 class TestUserEndpoints(TestCase):
-    def setUp(self):
-        self.client = Client()
-        user = baker.make(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = baker.make(
             User,
             email="test@example.com",
             password="password123",
             first_name="Test",
             last_name="User",
         )
-        self.client.force_login(user)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
         self.base_url = "/api/users/"
 
     def test_me_endpoint_with_authenticated_user(self):
@@ -26,6 +29,18 @@ class TestUserEndpoints(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()["email"], "test@example.com")
 
+    def test_me_endpoint_with_model_backend_session(self):
+        """
+        Test that sessions logged in through Django's ModelBackend stay valid.
+        """
+        self.client.force_login(
+            self.user, backend="django.contrib.auth.backends.ModelBackend"
+        )
+        url = f"{self.base_url}me/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["email"], "test@example.com")
+
     def test_me_endpoint_with_unauthenticated_user(self):
         """
         Test that me endpoint returns 401 unauthorized status code if user is not authenticated.
@@ -98,8 +113,10 @@ class TestUserEndpoints(TestCase):
     def test_status_api(self):
         """
         Test to check if the status API returns a 200 status code
+        The user of the session is never loaded for it
         """
         url = "/api/status/"
-        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), "The server is up!")
@@ -1,17 +1,22 @@
 from users.models import User
+from django.contrib.auth import authenticate
+from users.backends import UserBackend
 from django.test import Client, TestCase
 
 client = Client()
 
 
 class TestLoginUser(TestCase):
-    def setUp(self):
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             password="testpass123",
             email="testloginnew@example.com",
             first_name="Testloginnew",
             last_name="User",
         )
+
+    def setUp(self):
         self.login_url = "/api/users/login/"
         self.credentials = {
             "email": "testloginnew@example.com",
@@ -32,3 +37,17 @@ class TestLoginUser(TestCase):
         )
         self.assertEqual(response.status_code, 403)
         self.assertIn("User credentials did not match", str(response.content))
+
+    def test_authenticate_fetches_only_login_fields(self):
+        user = authenticate(
+            username=self.credentials["email"], password=self.credentials["password"]
+        )
+        self.assertEqual(user, self.user)
+        self.assertIn("first_name", user.get_deferred_fields())
+        self.assertNotIn("password", user.get_deferred_fields())
+
+    def test_get_user_defers_unused_fields(self):
+        user = UserBackend().get_user(self.user.pk)
+        self.assertEqual(user, self.user)
+        self.assertIn("last_login", user.get_deferred_fields())
+        self.assertNotIn("password", user.get_deferred_fields())
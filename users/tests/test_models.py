@@ -7,8 +7,9 @@ from users.models import User
 
 
 class UserModelTestCase(TestCase):
-    def setUp(self):
-        self.user = baker.make(User)
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = baker.make(User)
 
     def test_user_str_method(self):
         self.assertEqual(
@@ -26,6 +27,7 @@ class UserModelTestCase(TestCase):
         )
 
         self.assertIsNotNone(user.id)
+        self.assertEqual(user.id.version, 7)
         self.assertEqual(user.email, email)
         self.assertEqual(user.first_name, first_name)
         self.assertEqual(user.last_name, last_name)
@@ -69,3 +71,23 @@ class UserModelTestCase(TestCase):
                 first_name=first_name,
                 last_name=last_name,
             )
+
+    def test_bulk_create_users(self):
+        users_data = [
+            {
+                "email": f"bulk{i}@Example.com",
+                "password": f"password{i}",
+                "first_name": "Bulk",
+                "last_name": f"User{i}",
+            }
+            for i in range(3)
+        ]
+
+        users = User.objects.bulk_create_users(users_data)
+
+        self.assertEqual(len(users), 3)
+        for i, user in enumerate(users):
+            user = User.objects.get(pk=user.pk)
+            self.assertEqual(user.email, f"bulk{i}@example.com")
+            self.assertEqual(user.last_name, f"User{i}")
+            self.assertTrue(user.check_password(f"password{i}"))